@@ -5,21 +5,73 @@ Only places waypoints on passable terrain by parsing map files.
 """
 
 import argparse
+import contextlib
+import io
+import mmap
 import os
 import random
 import sys
+import zlib
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from collections import deque
+
+
+# Byte translation table: '.' (passable) -> 1, everything else -> 0
+PASSABLE_TABLE = bytes(1 if b == ord('.') else 0 for b in range(256))
+
+MASK64 = 0xFFFFFFFFFFFFFFFF
+
+# Random draws tried when resolving a waypoint conflict before scanning the whole component
+MAX_CONFLICT_DRAWS = 64
+
+# Everything derived from a map, computed once per map and shared by all of its scenarios
+MapCtx = namedtuple('MapCtx', 'height width free_cells passable comp_id comp_cells nearest_free')
+
+
+def splitmix64(x):
+    """SplitMix64 step: scramble a 64-bit integer."""
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+
+def mix_seed(seed, path_key, *keys):
+    """
+    Derive a 64-bit RNG seed from the global seed, a scenario path key and integer keys.
+    Unlike hash(), the result does not depend on PYTHONHASHSEED, so it is the same in
+    every process and every run.
+    """
+    x = splitmix64((seed ^ path_key) & MASK64)
+    for key in keys:
+        x = splitmix64(x ^ (key & MASK64))
+    return x
+
+
+def read_lines(path):
+    """
+    Read a file as a list of byte lines without line endings.
+    The file is memory-mapped and split in a single pass.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []  # Empty files cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return mm[:].splitlines()
 
 
 def load_map_free_cells(map_path):
     """
     Load a .map file and return list of free cells [(r,c), ...].
-    Returns (height, width, free_cells, grid) tuple.
+    Returns (height, width, free_cells, passable, nearest_free) tuple, where passable
+    is a flat bytearray mask of the grid padded by one blocked cell on each side: cell
+    (r, c) is at index (r + 1) * (width + 2) + (c + 1). nearest_free is the matching
+    nearest-free-cell map from nearest_free_map.
     """
     try:
-        with open(map_path, 'r') as f:
-            lines = [line.rstrip('\n\r') for line in f.readlines()]
+        lines = read_lines(map_path)
         
         # Parse header
         if len(lines) < 4:
@@ -40,51 +92,148 @@ def load_map_free_cells(map_path):
             else:
                 raise ValueError(f"Map file {map_path} has insufficient grid lines")
         
-        # Find free cells (passable terrain)
+        # Find free cells (passable terrain), letting bytes.find scan each row in C
         free_cells = []
-        for r in range(height):
-            for c in range(width):
-                if r < len(grid) and c < len(grid[r]) and grid[r][c] == '.':
-                    free_cells.append((r, c))
+        for r, row in enumerate(grid):
+            c = row.find(b'.', 0, width)
+            while c != -1:
+                free_cells.append((r, c))
+                c = row.find(b'.', c + 1, width)
         
-        return height, width, free_cells, grid
+        passable = build_passable(grid, height, width)
+        nearest_free = nearest_free_map(passable, height, width)
+        
+        return height, width, free_cells, passable, nearest_free
         
     except Exception as e:
         print(f"Error loading map {map_path}: {e}")
-        return None, None, [], []
+        return None, None, [], None, None
 
 
-def bfs_reachable(grid, start):
-    """Return set of cells reachable from `start`."""
-    height, width = len(grid), len(grid[0]) if grid else 0
-    start_r, start_c = start
+def build_passable(grid, height, width):
+    """
+    Pack grid rows (bytes, or str as in the legacy grid format) into a padded
+    passable mask so neighbor tests need no bounds checks: cell (r, c) is at
+    index (r + 1) * (width + 2) + (c + 1).
+    """
+    stride = width + 2
+    passable = bytearray(stride * (height + 2))
+    for r, row in enumerate(grid[:height]):
+        if isinstance(row, str):
+            row = row.encode('ascii', 'replace')  # Keeps one byte per cell
+        row_mask = row[:width].translate(PASSABLE_TABLE)
+        start = (r + 1) * stride + 1
+        passable[start:start + len(row_mask)] = row_mask
+    return passable
+
+
+def bfs_flat(passable, stride, start_idx, visited, queue):
+    """
+    Breadth-first search over a padded passable mask using flat cell indices.
+    Reached cells are flagged in visited and written to queue in BFS order.
+    Returns the number of cells reached (0 if start_idx is blocked or already visited).
+    """
+    if not passable[start_idx] or visited[start_idx]:
+        return 0
     
-    # Check if start is valid and passable
-    if (start_r < 0 or start_r >= height or 
-        start_c < 0 or start_c >= width or 
-        grid[start_r][start_c] != '.'):
-        return set()
+    offsets = (-stride, stride, -1, 1)
+    visited[start_idx] = 1
+    queue[0] = start_idx
+    head, tail = 0, 1
     
-    visited = set()
-    queue = deque([start])
-    visited.add(start)
+    while head < tail:
+        idx = queue[head]
+        head += 1
+        
+        for offset in offsets:
+            nidx = idx + offset
+            # The padding ring is never passable, so no bounds checks are needed
+            if passable[nidx] and not visited[nidx]:
+                visited[nidx] = 1
+                queue[tail] = nidx
+                tail += 1
     
-    directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+    return tail
+
+
+def label_components(passable, height, width, free_cells):
+    """
+    Label the 4-connected components of the passable terrain.
+    Returns (comp_id, comp_cells): comp_id is a flat array indexed by r * width + c
+    holding each cell's component id (-1 for blocked cells), and comp_cells maps
+    each component id to an array of its flat cell indices (r * width + c) in the
+    same row-major order as free_cells.
+    """
+    stride = width + 2
+    comp_id = array('i', [-1]) * (height * width)
+    comp_cells = {}
     
-    while queue:
-        r, c = queue.popleft()
-        
-        for dr, dc in directions:
-            nr, nc = r + dr, c + dc
-            if (0 <= nr < height and 0 <= nc < width and 
-                (nr, nc) not in visited and grid[nr][nc] == '.'):
-                visited.add((nr, nc))
-                queue.append((nr, nc))
+    # Components are disjoint, so one visited buffer serves every flood-fill
+    visited = bytearray(len(passable))
+    queue = array('i', [0]) * len(passable)
     
-    return visited
+    for r, c in free_cells:
+        idx = r * width + c
+        if comp_id[idx] == -1:
+            # First cell of a new component, flood-fill it once for the whole map
+            cid = len(comp_cells)
+            comp_cells[cid] = array('i')
+            n_reached = bfs_flat(passable, stride, (r + 1) * stride + c + 1, visited, queue)
+            for i in range(n_reached):
+                pr, pc = divmod(queue[i], stride)
+                comp_id[(pr - 1) * width + pc - 1] = cid
+        comp_cells[comp_id[idx]].append(idx)
+    
+    return comp_id, comp_cells
 
 
-def fix_agent_position(s_row, s_col, height, width, grid, free_cells):
+def nearest_free_map(passable, height, width):
+    """
+    Map every cell to its Manhattan-nearest free cell with one multi-source BFS.
+    Returns a flat array on the padded layout of passable holding the padded index
+    of the nearest free cell (ties go to the first in row-major order), or -1 for
+    every cell if the map has no free cells.
+    """
+    stride = width + 2
+    size = len(passable)
+    nearest = array('i', [-1]) * size
+    dist = array('i', [-1]) * size
+    
+    # Mark the padding ring as settled so the search never leaves the map
+    for c in range(stride):
+        dist[c] = dist[(height + 1) * stride + c] = -2
+    for r in range(1, height + 1):
+        dist[r * stride] = dist[r * stride + stride - 1] = -2
+    
+    # Seed with every free cell at distance 0, in row-major order
+    frontier = [idx for idx, is_free in enumerate(passable) if is_free]
+    for idx in frontier:
+        dist[idx] = 0
+        nearest[idx] = idx
+    
+    # Expand one Manhattan ring at a time over all cells, blocked or not. A cell's
+    # nearest free cells are exactly those of its neighbors one ring closer, so
+    # keeping the smallest index reproduces the row-major tie-break.
+    d = 0
+    while frontier:
+        d += 1
+        next_frontier = []
+        for idx in frontier:
+            src = nearest[idx]
+            for nidx in (idx - stride, idx + stride, idx - 1, idx + 1):
+                nd = dist[nidx]
+                if nd == -1:
+                    dist[nidx] = d
+                    nearest[nidx] = src
+                    next_frontier.append(nidx)
+                elif nd == d and src < nearest[nidx]:
+                    nearest[nidx] = src
+        frontier = next_frontier
+    
+    return nearest
+
+
+def fix_agent_position(s_row, s_col, height, width, passable, nearest_free):
     """
     Fix an agent's position if it's invalid.
     Returns (fixed_row, fixed_col, was_fixed).
@@ -95,47 +244,55 @@ def fix_agent_position(s_row, s_col, height, width, grid, free_cells):
     was_clamped = (fixed_row != s_row or fixed_col != s_col)
     
     # Check if the position is on passable terrain
-    if grid[fixed_row][fixed_col] == '.':
+    stride = width + 2
+    idx = (fixed_row + 1) * stride + fixed_col + 1
+    if passable[idx]:
         return fixed_row, fixed_col, was_clamped
     
-    # Position is on obstacle, find nearest passable cell
-    if not free_cells:
+    # Position is on obstacle, move to the precomputed nearest passable cell
+    if nearest_free[idx] < 0:
         return fixed_row, fixed_col, True  # No free cells available
     
-    # Find closest free cell using Manhattan distance
-    best_distance = float('inf')
-    best_cell = free_cells[0]
-    
-    for r, c in free_cells:
-        distance = abs(r - fixed_row) + abs(c - fixed_col)
-        if distance < best_distance:
-            best_distance = distance
-            best_cell = (r, c)
-    
-    return best_cell[0], best_cell[1], True
+    r, c = divmod(nearest_free[idx], stride)
+    return r - 1, c - 1, True
+
+
+def build_map_ctx(height, width, free_cells, passable, nearest_free=None):
+    """
+    Build the MapCtx for a loaded map, labeling its components and computing the
+    nearest-free-cell map if not given.
+    """
+    if nearest_free is None:
+        nearest_free = nearest_free_map(passable, height, width)
+    comp_id, comp_cells = label_components(passable, height, width, free_cells)
+    return MapCtx(height, width, free_cells, passable, comp_id, comp_cells, nearest_free)
 
 
 def process_scenario_file(scen_path, output_path, free_cells, grid, n_waypoints, height, width):
     """
     Process a single .scen file, adding waypoints to each agent line.
-    Legacy function for backwards compatibility.
+    Legacy function for backwards compatibility: grid is the list of map rows
+    as in the original API, packed into a passable mask here.
     Returns number of agents processed.
     """
     output_paths = {n_waypoints: output_path}
     waypoint_counts = [n_waypoints]
-    return process_scenario_file_multiple(scen_path, output_paths, free_cells, grid, waypoint_counts, height, width, seed=0)
+    passable = build_passable(grid, height, width)
+    ctx = build_map_ctx(height, width, free_cells, passable)
+    return process_scenario_file_multiple(scen_path, output_paths, ctx, waypoint_counts, seed=0)
 
 
-def process_scenario_file_multiple(scen_path, output_paths, free_cells, grid, waypoint_counts, height, width, seed=0):
+def process_scenario_file_multiple(scen_path, output_paths, ctx, waypoint_counts, seed=0):
     """
     Process a single .scen file, generating multiple output files with hierarchical waypoints.
     output_paths: dict mapping waypoint count to output path
+    ctx: MapCtx of the scenario's map
     waypoint_counts: list of waypoint counts (e.g., [2, 4, 8])
     Returns number of agents processed.
     """
     try:
-        with open(scen_path, 'r') as f:
-            lines = [line.rstrip('\n\r') for line in f.readlines()]
+        # Lines stay as bytes; they are copied to the outputs without decoding
+        lines = read_lines(scen_path)
     except Exception as e:
         print(f"Warning: Could not read {scen_path}: {e}")
         return 0
@@ -143,7 +300,7 @@ def process_scenario_file_multiple(scen_path, output_paths, free_cells, grid, wa
     if not lines:
         # Empty file, create empty outputs
         for output_path in output_paths.values():
-            with open(output_path, 'w') as f:
+            with open(output_path, 'wb') as f:
                 pass
         return 0
     
@@ -151,204 +308,184 @@ def process_scenario_file_multiple(scen_path, output_paths, free_cells, grid, wa
     agents_processed = 0
     agents_fixed = 0
     
+    height, width, passable = ctx.height, ctx.width, ctx.passable
+    comp_id, comp_cells, nearest_free = ctx.comp_id, ctx.comp_cells, ctx.nearest_free
+    
     # Check if first line is a header
     header_line = None
     start_idx = 0
-    if lines and (lines[0].startswith('version') or lines[0].startswith('Version')):
+    if lines and (lines[0].startswith(b'version') or lines[0].startswith(b'Version')):
         header_line = lines[0]
         start_idx = 1
     
-    # First pass: collect all agents and their reachable cells
-    agent_data = []
+    # First pass: collect all agents and their reachable cells. Agents are stored as
+    # parallel arrays indexed by agent slot, in file order.
+    line_nums = array('i')  # Line number of each agent, also its seeding ID
+    comp_ids = array('i')   # Component of each agent's (possibly fixed) start position
+    fields_list = []        # Original fields of each agent, with fixed coordinates
+    non_agent_lines = []    # (line number, raw line) of lines copied to the outputs as-is
+    stride = width + 2
 
     for i, line in enumerate(lines[start_idx:], start_idx + 1):
         if not line.strip():
+            non_agent_lines.append((i, line))
             continue
 
-        fields = line.split('\t')
+        fields = line.split(b'\t')
         if len(fields) != 9:
+            # Not a standard agent line
+            non_agent_lines.append((i, line))
             continue
 
         try:
             # Parse agent coordinates (field 4 = x-coordinate/column, field 5 = y-coordinate/row)
             s_col = int(fields[4])  # start x-coordinate (column)
             s_row = int(fields[5])  # start y-coordinate (row)
+        except ValueError as e:
+            # Unparsable agents get no slot and are copied to the outputs as-is
+            print(f"  Warning: Could not parse agent {i}: {e}")
+            non_agent_lines.append((i, line))
+            continue
 
-            # Fix agent position if necessary
-            fixed_row, fixed_col, was_fixed = fix_agent_position(s_row, s_col, height, width, grid, free_cells)
-
-            if was_fixed:
-                agents_fixed += 1
-                if s_row < 0 or s_row >= height or s_col < 0 or s_col >= width:
-                    print(f"  Fixed out-of-bounds agent {i}: ({s_col},{s_row}) -> ({fixed_col},{fixed_row})")
-                else:
-                    print(f"  Fixed agent {i} on obstacle: ({s_col},{s_row}) -> ({fixed_col},{fixed_row})")
+        if 0 <= s_row < height and 0 <= s_col < width and passable[(s_row + 1) * stride + s_col + 1]:
+            # Valid start on passable terrain, the common case
+            fixed_row, fixed_col = s_row, s_col
+        else:
+            # Fix agent position and report it
+            fixed_row, fixed_col, _ = fix_agent_position(s_row, s_col, height, width, passable, nearest_free)
+            agents_fixed += 1
+            if s_row < 0 or s_row >= height or s_col < 0 or s_col >= width:
+                print(f"  Fixed out-of-bounds agent {i}: ({s_col},{s_row}) -> ({fixed_col},{fixed_row})")
+            else:
+                print(f"  Fixed agent {i} on obstacle: ({s_col},{s_row}) -> ({fixed_col},{fixed_row})")
 
-                # Update the fields with fixed coordinates
-                fields[4] = str(fixed_col)  # x-coordinate
-                fields[5] = str(fixed_row)  # y-coordinate
+            # Update the fields with fixed coordinates
+            fields[4] = b'%d' % fixed_col  # x-coordinate
+            fields[5] = b'%d' % fixed_row  # y-coordinate
 
-            # Find reachable cells from the (possibly fixed) start position
-            reachable = bfs_reachable(grid, (fixed_row, fixed_col))
-            reachable_cells = [(r, c) for (r, c) in free_cells if (r, c) in reachable]
+        # Reachable cells are those in the same component as the (possibly fixed) start position
+        cid = comp_id[fixed_row * width + fixed_col]
+        n_reachable = len(comp_cells.get(cid, ()))
 
-            if len(reachable_cells) < max_waypoints:
-                print(f"  Warning: Agent {i} has only {len(reachable_cells)} reachable cells, need {max_waypoints}")
+        if n_reachable < max_waypoints:
+            print(f"  Warning: Agent {i} has only {n_reachable} reachable cells, need {max_waypoints}")
 
-            agent_data.append({
-                'line_num': i,
-                'fields': fields,
-                'reachable_cells': reachable_cells,
-                'original_line': line,
-                'agent_id': i  # Add agent ID for seeding
-            })
+        line_nums.append(i)
+        comp_ids.append(cid)
+        fields_list.append(fields)
 
-        except (ValueError, IndexError) as e:
-            print(f"  Warning: Could not parse agent {i}: {e}")
-            agent_data.append({
-                'line_num': i,
-                'fields': None,
-                'reachable_cells': [],
-                'original_line': line,
-                'agent_id': i
-            })
-
-    agents_processed = len([a for a in agent_data if a['fields'] is not None])
-    max_waypoints = max(waypoint_counts)
+    agents_processed = len(line_nums)
 
-    # Second pass: generate hierarchical waypoints for max_waypoints, then subset for each count
-    all_agent_waypoints = {}  # Maps agent line number to list of waypoints
+    # Second pass: generate hierarchical waypoints for max_waypoints, then subset for each count.
+    # Waypoints are flat cell indices (r * width + c) until they are written out.
+    agent_waypoints = [[] for _ in range(agents_processed)]  # Waypoint list of each agent slot
 
-    for agent_info in agent_data:
-        if agent_info['fields'] is None:
-            continue
+    # One generator per file, reseeded per draw rather than constructed per agent
+    rng = random.Random()
+    path_key = zlib.crc32(str(scen_path).encode())
 
-        i = agent_info['line_num']
-        reachable_cells = agent_info['reachable_cells']
+    for k in range(agents_processed):
+        reachable_cells = comp_cells.get(comp_ids[k], ())
 
         # Generate waypoints for this agent using agent-specific seeding
-        waypoint_cells = []
         if max_waypoints > 0 and len(reachable_cells) > 0:
-            # Create agent-specific random generator for hierarchical consistency
-            agent_seed = hash((seed, agent_info['agent_id'], scen_path))
-            agent_rng = random.Random(agent_seed)
+            # Seed agent-specifically for hierarchical consistency
+            rng.seed(mix_seed(seed, path_key, line_nums[k]))
 
             if len(reachable_cells) >= max_waypoints:
-                # Sample from reachable cells
-                waypoint_cells = agent_rng.sample(reachable_cells, max_waypoints)
+                # Sample positions in the cell buffer, then look up only the chosen cells
+                picks = rng.sample(range(len(reachable_cells)), max_waypoints)
+                agent_waypoints[k] = [reachable_cells[j] for j in picks]
             else:
                 # Use all available reachable cells
-                waypoint_cells = reachable_cells[:max_waypoints]
-
-        all_agent_waypoints[i] = waypoint_cells
-
-    # Generate waypoint assignments with per-position uniqueness and hierarchical consistency
-    global_assignments = {}  # Maps (agent_id, n_waypoints) -> list of waypoints
+                agent_waypoints[k] = list(reachable_cells)
 
-    # Process each waypoint position to ensure uniqueness within each position
-    max_waypoints = max(waypoint_counts) if waypoint_counts else 0
+    # Generate waypoint assignments with per-position uniqueness and hierarchical consistency.
+    # Cells taken at the current position are flagged in a byte per flat cell index.
+    used_at_position = bytearray(height * width)
 
-    # For each waypoint position, resolve conflicts
     for pos in range(max_waypoints):
-        used_at_position = set()
+        taken = []
 
-        # Sort agents by conflict potential at this position (deterministic order)
-        agents_at_position = []
-        for agent_info in agent_data:
-            if agent_info['fields'] is None:
+        for k in range(agents_processed):
+            waypoints = agent_waypoints[k]
+            if pos >= len(waypoints):
                 continue
-            i = agent_info['line_num']
-            if i in all_agent_waypoints and pos < len(all_agent_waypoints[i]):
-                agents_at_position.append((i, agent_info))
 
-        # Process agents in deterministic order (by agent line number)
-        agents_at_position.sort(key=lambda x: x[0])
+            hierarchical_waypoint = waypoints[pos]
 
-        for i, agent_info in agents_at_position:
-            hierarchical_waypoint = all_agent_waypoints[i][pos]
-            reachable_cells = agent_info['reachable_cells']
-
-            if hierarchical_waypoint not in used_at_position:
+            if not used_at_position[hierarchical_waypoint]:
                 # Can use the hierarchical waypoint
                 final_waypoint = hierarchical_waypoint
             else:
                 # Need alternative - find one that's not used at this position
-                agent_seed = hash((seed, agent_info['agent_id'], scen_path, pos))
-                agent_rng = random.Random(agent_seed)
-
-                available = [cell for cell in reachable_cells if cell not in used_at_position]
-                if available:
-                    agent_rng.shuffle(available)
-                    final_waypoint = available[0]
+                rng.seed(mix_seed(seed, path_key, line_nums[k], pos))
+
+                reachable_cells = comp_cells.get(comp_ids[k], ())
+                n_cells = len(reachable_cells)
+                # Draw random cells until one is free; scan the component only if it is crowded
+                for _ in range(MAX_CONFLICT_DRAWS):
+                    cell = reachable_cells[rng.randrange(n_cells)]
+                    if not used_at_position[cell]:
+                        final_waypoint = cell
+                        break
                 else:
-                    # If no alternatives, keep the hierarchical waypoint (rare case)
-                    final_waypoint = hierarchical_waypoint
+                    available = [cell for cell in reachable_cells if not used_at_position[cell]]
+                    if available:
+                        final_waypoint = rng.choice(available)
+                    else:
+                        # If no alternatives, keep the hierarchical waypoint (rare case)
+                        final_waypoint = hierarchical_waypoint
 
             # Update the waypoint at this position
-            all_agent_waypoints[i][pos] = final_waypoint
-            used_at_position.add(final_waypoint)
-
-    # Now generate output files with simple hierarchical slicing
-    for n_waypoints in waypoint_counts:
-        for agent_info in agent_data:
-            if agent_info['fields'] is not None:
-                i = agent_info['line_num']
-                if i in all_agent_waypoints:
-                    waypoints = all_agent_waypoints[i][:n_waypoints]
-                else:
-                    waypoints = []
-                global_assignments[(i, n_waypoints)] = waypoints
-
-    # Generate output files for each waypoint count
-    for n_waypoints in waypoint_counts:
-        output_lines = []
-
-        # Add header if present
-        if header_line:
-            output_lines.append(header_line)
-
-        # Process each line to generate output
-        for i, line in enumerate(lines[start_idx:], start_idx + 1):
-            if not line.strip():
-                output_lines.append(line)
-                continue
-
-            fields = line.split('\t')
-            if len(fields) != 9:
-                # Not a standard agent line, copy as-is
-                output_lines.append(line)
-                continue
-
-            # Find corresponding agent data
-            agent_info = None
-            for agent in agent_data:
-                if agent['line_num'] == i:
-                    agent_info = agent
-                    break
-
-            if not agent_info or agent_info['fields'] is None:
-                output_lines.append(line)  # Copy as-is
-                continue
-
-            fields = agent_info['fields']
-
-            # Get final waypoint assignment for this agent and waypoint count
-            waypoint_cells = global_assignments.get((i, n_waypoints), [])
-
-            # Build the output line
-            tail = [str(len(waypoint_cells))]
-            for r, c in waypoint_cells:
-                tail.extend([str(c), str(r)])  # x-coordinate (column), y-coordinate (row)
-
-            output_line = '\t'.join(fields + tail)
-            output_lines.append(output_line)
-
-        # Write output for this waypoint count
+            waypoints[pos] = final_waypoint
+            used_at_position[final_waypoint] = 1
+            taken.append(final_waypoint)
+
+        # Clear only the flags set at this position
+        for cell in taken:
+            used_at_position[cell] = 0
+
+    # Build all outputs in a single pass over the parsed agents, one byte buffer per file
+    out_bufs = [(n_waypoints, bytearray()) for n_waypoints in waypoint_counts]
+
+    def copy_line(line):
+        line += b'\n'
+        for _, buf in out_bufs:
+            buf += line
+
+    # Add header if present
+    if header_line:
+        copy_line(header_line)
+
+    next_copy = 0
+    for k in range(agents_processed):
+        # Blank, non-agent and unparsable lines before this agent are copied as-is
+        while next_copy < len(non_agent_lines) and non_agent_lines[next_copy][0] < line_nums[k]:
+            copy_line(non_agent_lines[next_copy][1])
+            next_copy += 1
+
+        # The original fields are shared by every output file
+        prefix = b'\t'.join(fields_list[k]) + b'\t'
+
+        # Waypoints are hierarchical, so each count takes a prefix of the full list
+        waypoint_strs = [b'%d\t%d' % (idx % width, idx // width) for idx in agent_waypoints[k]]  # x (column), y (row)
+
+        for n_waypoints, buf in out_bufs:
+            tail = waypoint_strs[:n_waypoints]
+            buf += prefix
+            buf += b'\t'.join([b'%d' % len(tail)] + tail)
+            buf += b'\n'
+
+    for _, line in non_agent_lines[next_copy:]:
+        copy_line(line)
+
+    # Write each output with a single call
+    for n_waypoints, buf in out_bufs:
         output_path = output_paths[n_waypoints]
         try:
-            with open(output_path, 'w') as f:
-                for line in output_lines:
-                    f.write(line + '\n')
+            with open(output_path, 'wb') as f:
+                f.write(buf)
         except Exception as e:
             print(f"Warning: Could not write {output_path}: {e}")
             return 0
@@ -361,6 +498,35 @@ def process_scenario_file_multiple(scen_path, output_paths, free_cells, grid, wa
     return agents_processed
 
 
+# MapCtx of each map in a worker process, keyed by map name
+_worker_maps = {}
+
+
+def _init_worker(maps):
+    """Process pool initializer: load the MapCtx of each map into worker globals."""
+    _worker_maps.update(maps)
+
+
+def _process_scenario_task(map_name, scen_path, output_paths, waypoint_counts, seed):
+    """
+    Process one .scen file in a worker process using that worker's MapCtx.
+    Returns (agents_processed, log) with the file's console output captured so the
+    parent can print it without interleaving.
+    """
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        agents = process_scenario_file_multiple(scen_path, output_paths, _worker_maps[map_name], waypoint_counts, seed)
+    return agents, log.getvalue()
+
+
+def positive_int(value):
+    """argparse type for options that must be a positive integer."""
+    n = int(value)
+    if n <= 0:
+        raise argparse.ArgumentTypeError(f"must be a positive integer, got {value}")
+    return n
+
+
 def main():
     parser = argparse.ArgumentParser(description='Generate waypoint-augmented scenario files')
     parser.add_argument('--maps', required=True, help='Directory containing .map files')
@@ -368,6 +534,7 @@ def main():
     parser.add_argument('--dst', required=True, help='Root directory for new waypoint scenarios')
     parser.add_argument('--n', type=int, help='Number of waypoints per agent (legacy mode, generates only one file)')
     parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    parser.add_argument('--workers', type=positive_int, default=os.cpu_count() or 1, help='Number of worker processes (default: CPU count)')
     
     args = parser.parse_args()
     
@@ -404,18 +571,18 @@ def main():
     maps = {}
     for map_file in maps_dir.glob('*.map'):
         map_name = map_file.stem
-        height, width, free_cells, grid = load_map_free_cells(map_file)
+        height, width, free_cells, passable, nearest_free = load_map_free_cells(map_file)
         if height is not None:
-            maps[map_name] = (height, width, free_cells, grid)
-            print(f"Loaded map {map_file.name}: {height}x{width}, {len(free_cells)} free cells")
+            ctx = build_map_ctx(height, width, free_cells, passable, nearest_free)
+            maps[map_name] = ctx
+            print(f"Loaded map {map_file.name}: {height}x{width}, {len(free_cells)} free cells, {len(ctx.comp_cells)} components")
     
     if not maps:
         print("Error: No valid map files found")
         return 1
     
-    # Process scenario folders
-    total_files = 0
-    total_agents = 0
+    # Collect scenario tasks; files are independent given the map and seed
+    tasks = []
     
     for src_subdir in src_dir.iterdir():
         if not src_subdir.is_dir():
@@ -426,7 +593,7 @@ def main():
             print(f"Warning: No map file found for {map_name}, skipping")
             continue
         
-        height, width, free_cells, grid = maps[map_name]
+        free_cells = maps[map_name].free_cells
         
         max_waypoints = max(waypoint_counts)
         if len(free_cells) < max_waypoints:
@@ -453,18 +620,34 @@ def main():
             output_paths = {}
             for n_waypoints in waypoint_counts:
                 output_paths[n_waypoints] = dst_subdirs[n_waypoints] / scen_file.name
+            tasks.append((map_name, scen_file, output_paths))
+    
+    # Process scenario files in parallel, sharing only the maps that are used
+    total_files = 0
+    total_agents = 0
+    used_maps = {map_name: maps[map_name] for map_name, _, _ in tasks}
+    
+    # Every worker unpickles all used maps, so start no more workers than there are files
+    if tasks:
+        n_workers = min(args.workers, len(tasks))
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(used_maps,)) as executor:
+            futures = [executor.submit(_process_scenario_task, map_name, scen_file, output_paths, waypoint_counts, args.seed)
+                       for map_name, scen_file, output_paths in tasks]
             
-            if args.n is not None:
-                print(f"Processing {scen_file.name} with {args.n} waypoints...")
-            else:
-                print(f"Processing {scen_file.name} for {waypoint_counts} waypoints...")
+            # Report results in submission order
+            for (map_name, scen_file, output_paths), future in zip(tasks, futures):
+                if args.n is not None:
+                    print(f"Processing {scen_file.name} with {args.n} waypoints...")
+                else:
+                    print(f"Processing {scen_file.name} for {waypoint_counts} waypoints...")
             
-            agents = process_scenario_file_multiple(scen_file, output_paths, free_cells, grid, waypoint_counts, height, width, args.seed)
-            total_agents += agents
-            if args.n is not None:
-                total_files += 1  # Legacy mode: one file per scenario
-            else:
-                total_files += len(waypoint_counts)  # New mode: multiple files per scenario
+                agents, log = future.result()
+                print(log, end='')
+                total_agents += agents
+                if args.n is not None:
+                    total_files += 1  # Legacy mode: one file per scenario
+                else:
+                    total_files += len(waypoint_counts)  # New mode: multiple files per scenario
     
     print(f"\nGenerated {total_files} waypoint files.")
     print(f"Total agents processed: {total_agents}.")
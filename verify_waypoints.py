@@ -3,26 +3,138 @@
 Verify that waypoint sequences are consistent across different N values.
 """
 
+import mmap
+import os
 import sys
+from array import array
+from functools import lru_cache
+from itertools import islice, zip_longest
 
+def find_original_end(line):
+    """
+    Return the offset of the tab that ends the 9 original fields of a raw agent
+    line, or -1 if the line has fewer than 10 fields.
+    """
+    pos = -1
+    for _ in range(9):
+        pos = line.find(b'\t', pos + 1)
+        if pos < 0:
+            return -1
+    return pos
+
+@lru_cache(maxsize=None)
 def parse_agent_line(line):
-    """Parse an agent line and return (original_fields, waypoints)."""
-    fields = line.strip().split('\t')
-    if len(fields) < 10:
-        return None, []
+    """
+    Parse a raw agent line (bytes) and return (original_fields, waypoints).
+    original_fields is the raw bytes prefix holding the 9 original fields, so two
+    agents' original data can be compared with a single bytes comparison.
+    Waypoints are a packed flat array('q') of coordinates: x1, y1, x2, y2, ...
+    Results are memoized on the line bytes, so repeated agents are parsed once;
+    the returned objects are shared and must not be modified.
+    """
+    line = line.strip()
+    end = find_original_end(line)
+    if end < 0:
+        return None, array('q')
     
     # First 9 fields are original, then waypoint count, then waypoint coordinates
-    original_fields = fields[:9]
-    waypoint_count = int(fields[9])
+    original_fields = line[:end]
+    fields = line[end + 1:].split(b'\t', 1)
+    waypoint_count = int(fields[0])
     
-    waypoints = []
-    for i in range(waypoint_count):
-        x = int(fields[10 + i*2])
-        y = int(fields[10 + i*2 + 1])
-        waypoints.append((x, y))
+    # Split the tail no further than the declared coordinates and convert it in one bulk pass
+    n_coords = max(2 * waypoint_count, 0)
+    coords = []
+    if n_coords > 0 and len(fields) > 1:
+        coords = fields[1].split(b'\t', n_coords)
+    if len(coords) < n_coords:
+        raise IndexError(f"Expected {waypoint_count} waypoints, found {len(coords) // 2}")
+    # Any unsplit remainder past the declared coordinates is simply not read
+    waypoints = array('q', map(int, islice(coords, n_coords)))
     
     return original_fields, waypoints
 
+def format_waypoints(waypoints):
+    """Format a flat waypoint array as a list of (x, y) pairs for reporting."""
+    return str(list(zip(waypoints[0::2], waypoints[1::2])))
+
+def iter_agent_lines(path):
+    """
+    Yield the agent lines of a waypoint scenario file as stripped bytes.
+    The file is memory-mapped and streamed line by line; the header is skipped.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return  # Empty files cannot be mapped
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Stream lines straight out of the mapping rather than copying the whole file first
+            lines = filter(None, map(bytes.strip, iter(mm.readline, b'')))
+            
+            # The scen format has a single header line; drop it once instead of testing every line
+            first = next(lines, None)
+            if first is not None and not first.startswith(b'version'):
+                yield first
+            yield from lines
+
+def prefetch(path):
+    """
+    Ask the kernel to start reading a file into the page cache in the background.
+    This is only a hint: it is a no-op where posix_fadvise is unavailable, and
+    errors are left for the actual read to report.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        with open(path, 'rb') as f:
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+    except OSError:
+        pass
+
+def lines_match(line1, line2):
+    """
+    Check on raw bytes whether line2 has the same original fields as line1 and
+    starts its waypoints with all of line1's waypoints.
+    Returns False whenever that cannot be shown without parsing; callers then
+    fall back to parse_agent_line for the exact result.
+    """
+    # End of the 9 original fields: they must be byte-identical
+    pos = find_original_end(line1)
+    if pos < 0:
+        return False
+    if not line2.startswith(line1[:pos + 1]):
+        return False
+    
+    # A line without waypoints ends right after its count field
+    end1 = line1.find(b'\t', pos + 1)
+    end2 = line2.find(b'\t', pos + 1)
+    if end1 < 0:
+        end1 = len(line1)
+    if end2 < 0:
+        end2 = len(line2)
+    try:
+        n1 = int(line1[pos + 1:end1])
+        n2 = int(line2[pos + 1:end2])
+    except ValueError:
+        return False
+    
+    # line1 must hold exactly its declared waypoints, line2 at least its own
+    tail_tabs = line1.count(b'\t') - 9
+    if n1 < 0 or n2 < n1 or tail_tabs != 2 * n1 or line2.count(b'\t') - 9 < 2 * n2:
+        return False
+    if n2 == 0:
+        return True  # No coordinates are read from either line
+    
+    # File1's coordinate text must be a whole-token prefix of file2's
+    tail_len = len(line1) - end1
+    if not line2.startswith(line1[end1:], end2):
+        return False
+    if len(line2) != end2 + tail_len and line2[end2 + tail_len] != 9:  # 9 == ord('\t')
+        return False
+    
+    # Every coordinate of line2 (and so of line1) must be a plain integer token;
+    # empty or non-digit tokens are left to parse_agent_line to report
+    return line2.find(b'\t\t', end2) < 0 and line2[end2 + 1:].replace(b'\t', b'').isdigit()
+
 def main():
     if len(sys.argv) != 3:
         print("Usage: python3 verify_waypoints.py <file1> <file2>")
@@ -34,23 +146,33 @@ def main():
     
     print(f"Comparing {file1_path} and {file2_path}")
     
-    # Read both files
-    with open(file1_path, 'r') as f1, open(file2_path, 'r') as f2:
-        lines1 = [line.strip() for line in f1.readlines()]
-        lines2 = [line.strip() for line in f2.readlines()]
+    # Stream both files in lockstep; file2 is prefetched so its I/O overlaps with file1's
+    prefetch(file2_path)
+    agent_lines1 = iter_agent_lines(file1_path)
+    agent_lines2 = iter_agent_lines(file2_path)
     
-    # Find agent lines (skip header)
-    agent_lines1 = [line for line in lines1 if line and not line.startswith('version')]
-    agent_lines2 = [line for line in lines2 if line and not line.startswith('version')]
+    # Count byte-level matches on the fly; only the other pairs are kept for parsing
+    matches = 0
+    unmatched = []
+    n_agents1 = n_agents2 = 0
+    for i, (line1, line2) in enumerate(zip_longest(agent_lines1, agent_lines2)):
+        if line1 is None or line2 is None:
+            # One file ran out: count what is left of both and stop comparing
+            n_agents1 = i + (line1 is not None) + sum(1 for _ in agent_lines1)
+            n_agents2 = i + (line2 is not None) + sum(1 for _ in agent_lines2)
+            break
+        if lines_match(line1, line2):
+            matches += 1
+        else:
+            unmatched.append((i, line1, line2))
     
-    if len(agent_lines1) != len(agent_lines2):
-        print(f"Error: Different number of agents ({len(agent_lines1)} vs {len(agent_lines2)})")
+    if n_agents1 != n_agents2:
+        print(f"Error: Different number of agents ({n_agents1} vs {n_agents2})")
         return 1
     
-    matches = 0
-    mismatches = 0
-    
-    for i, (line1, line2) in enumerate(zip(agent_lines1, agent_lines2)):
+    # Mismatches are recorded as (index, reason, data) and reported after the loop
+    mismatch_records = []
+    for i, line1, line2 in unmatched:
         original1, waypoints1 = parse_agent_line(line1)
         original2, waypoints2 = parse_agent_line(line2)
         
@@ -59,29 +181,37 @@ def main():
         
         # Check if original agent data matches
         if original1 != original2:
-            print(f"Agent {i+1}: Original data mismatch")
-            mismatches += 1
+            mismatch_records.append((i, 'original', None))
             continue
         
         # Check if first N waypoints of file2 match all waypoints of file1
-        n1 = len(waypoints1)
-        n2 = len(waypoints2)
+        n1 = len(waypoints1) // 2
+        n2 = len(waypoints2) // 2
         
         if n2 < n1:
-            print(f"Agent {i+1}: File2 has fewer waypoints ({n2}) than File1 ({n1})")
-            mismatches += 1
+            mismatch_records.append((i, 'fewer', (n1, n2)))
             continue
         
-        # Compare first n1 waypoints
-        first_n_waypoints2 = waypoints2[:n1]
-        if waypoints1 == first_n_waypoints2:
+        # Compare first n1 waypoints through a memoryview, so no copy of file2's prefix is made
+        if memoryview(waypoints2)[:2 * n1] == memoryview(waypoints1):
             matches += 1
         else:
+            mismatch_records.append((i, 'waypoints', (waypoints1, waypoints2)))
+    
+    for i, reason, data in mismatch_records:
+        if reason == 'original':
+            print(f"Agent {i+1}: Original data mismatch")
+        elif reason == 'fewer':
+            n1, n2 = data
+            print(f"Agent {i+1}: File2 has fewer waypoints ({n2}) than File1 ({n1})")
+        else:
+            waypoints1, waypoints2 = data
+            n1 = len(waypoints1) // 2
             print(f"Agent {i+1}: Waypoint mismatch")
-            print(f"  File1: {waypoints1}")
-            print(f"  File2 first {n1}: {first_n_waypoints2}")
-            mismatches += 1
+            print(f"  File1: {format_waypoints(waypoints1)}")
+            print(f"  File2 first {n1}: {format_waypoints(waypoints2[:2 * n1])}")
     
+    mismatches = len(mismatch_records)
     total = matches + mismatches
     print(f"\nResults:")
     print(f"  Total agents: {total}")